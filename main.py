@@ -1,15 +1,27 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 import random
 import ast
+import asyncio
 import json
 import re
 import time
+import functools
+import importlib.util
+import queue
+import atexit
+import threading
+import os
+import sqlite3
+import tempfile
 from io import BytesIO
-from gtts import gTTS
+from concurrent.futures import ThreadPoolExecutor
 from streamlit_gsheets import GSheetsConnection
 
+from srs import FSRS_MAX_DAYS, srs_step, fsrs_step, leitner_seed
+
 # =========================================================
 # 0) Config
 # =========================================================
@@ -21,63 +33,312 @@ QC_COLUMNS = [
     "options", "correct_answers", "llm_selected", "llm_is_correct", "flag", "reasons"
 ]
 
+# json.dumps(..., ensure_ascii=False)는 호출마다 JSONEncoder를 새로 만듦 → 인코더 하나를 재사용
+json_dumps = json.JSONEncoder(ensure_ascii=False).encode
+
+# Sheet1에 없으면 추가하는 컬럼과 기본값
+COLUMN_DEFAULTS = {
+    "mistake_count": 0, "box": 0, "next_review": "0000-00-00",
+    "example_blank": "", "collocations": "", "confusables": "",
+    "stability": 0.0, "difficulty": 0.0, "last_review": "0000-00-00",
+}
+
+# 콜드 스타트용 로컬 Parquet 스냅샷 (N초 안에 저장된 것만 사용, SRS 값이 시트에 써지면 삭제)
+VOCAB_SNAPSHOT = os.path.join(tempfile.gettempdir(), "toefl_voca_vocab.parquet")
+VOCAB_SNAPSHOT_TTL = 600
+
+# 리스트 문자열("['a', 'b']")로 저장된 컬럼 → 로드 시 한 번만 파싱해서 list로 보관
+LIST_COLUMNS = ["synonyms", "collocations", "confusables"]
+
+# next_review를 정수(epoch 기준 일수)로 다룰 때의 기준일. '0000-00-00'(미학습)은 0 → 항상 due
+EPOCH = datetime.date(1970, 1, 1)
+
+# 시트에 저장하는 SRS 컬럼 (update_srs가 한 행에서 바꾸는 컬럼 전부)
+SRS_COLUMNS = ('box', 'next_review', 'mistake_count', 'stability', 'difficulty', 'last_review')
+
+# 복습 간격(0 ~ FSRS_MAX_DAYS일)별 timedelta 미리 생성 → 답안마다 timedelta 새로 만들지 않음
+SRS_DAY_DELTAS = tuple(datetime.timedelta(days=d) for d in range(FSRS_MAX_DAYS + 1))
+
+# SRS 변경은 백그라운드 writer가 모았다가 N초마다 / N행마다(또는 세션 종료/화면 전환 시) 한 번에 저장
+SRS_FLUSH_INTERVAL = 5
+SRS_FLUSH_MAX = 20
+# 같은 묶음이 연속으로 이만큼 실패하면 포기 (뒤에 오는 쓰기까지 막히지 않도록)
+SRS_WRITE_RETRIES = 5
+
 DEFAULT_GEMINI_MODEL = "gemini-2.0-flash"  # 공식 문서 예시 모델 :contentReference[oaicite:2]{index=2}
 
+# 세션 시작 시 발음 MP3를 미리 생성할 단어 수 상한 (실제는 목표 문제 수 x3까지) / 동시 요청 수
+# vocab df에서 만든 세션 상태 (reload_vocab 후 다시 만듦)
+VOCAB_SESSION_KEYS = ('vocab_db', 'id_to_idx', 'srs', 'word_pools', 'base_candidates', 'candidate_pool',
+                      'question_shells')
+
+TTS_PREFETCH_MAX = 60
+TTS_PREFETCH_WORKERS = 8
+
+# QC 로그는 로컬 SQLite outbox에 먼저 쓰고, 백그라운드에서 N초마다 / 최대 N행씩 QC_Log 시트로 전송
+QC_LOCAL_DB = os.path.join(tempfile.gettempdir(), "toefl_voca_qc_log.sqlite3")
+QC_SYNC_INTERVAL = 10
+QC_SYNC_BATCH = 500
+
+# QC 시뮬레이션 Gemini 동시 호출 한도 (동시 요청 수 / 초당 요청 수, 티어 쿼터에 맞춰 조정)
+GEMINI_CONCURRENCY = 8
+GEMINI_RPS = 4
+
+# Gemini 선택 결과 공유 캐시 유지 시간 (초)
+GEMINI_PICK_TTL = 24 * 60 * 60
+
+# Batch API (대량 QC용): 폴링 최대 대기 시간, 종료 상태
+GEMINI_BATCH_TIMEOUT = 600
+GEMINI_BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# 선택 응답은 JSON으로만 받음 (JSON 모드를 거절하는 모델만 config 없이 → 텍스트에서 JSON 추출)
+GEMINI_PICK_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": {
+        "type": "object",
+        "properties": {"selected": {"type": "string"}, "rationale": {"type": "string"}},
+        "required": ["selected"],
+    },
+}
+
 # =========================================================
 # 1) Google Sheet 연결 + 데이터 로드
 # =========================================================
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 
-def load_data():
+def lower_columns(cols):
+    """컬럼명 소문자화. 보통은 이미 소문자라 Index를 새로 만들지 않고 그대로 반환"""
+    if all(str(c) == str(c).lower() for c in cols):
+        return cols
+    return cols.str.lower()
+
+
+def check_vocab_columns(df):
+    """시트/스냅샷 공통 검증: 필수 컬럼이 없으면 ValueError"""
+    if 'id' not in df.columns:
+        raise ValueError("ERROR: 'id' column not found in Sheet1.")
+
+
+def read_vocab_sheet():
+    """
+    Sheet1을 읽어서 컬럼/중복/타입 정리 (리스트 컬럼 파싱 전). 구조를 고쳤으면 시트에도 다시 씀.
+    반환: (df, 구조를 고쳐서 다시 썼는지)
+    """
+    df = conn.read(worksheet=SHEET_MAIN, ttl=0)
+    df.columns = lower_columns(df.columns)
+
+    # 중복 단어 제거 (보통은 중복이 없으므로 is_unique 확인만 하고 복사 X)
+    n_rows = len(df)
+    if 'word' in df.columns and not df['word'].is_unique:
+        df = df.drop_duplicates(subset=['word'], keep='first')
+    # 행 위치 == index 라벨 (id_to_idx가 이 위치를 가리킴)
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        df = df.reset_index(drop=True)
+
+    # 기본 SRS 컬럼 + MCQ용 컬럼 보장 (보통은 전부 있어서 아무것도 안 함)
+    missing = [c for c in COLUMN_DEFAULTS if c not in df.columns]
+    for col in missing:
+        df[col] = COLUMN_DEFAULTS[col]
+    # 중복이 빠졌으면 시트도 다시 씀 (SRS writer는 시트 id 컬럼으로 행을 찾으므로 행 위치와는 무관)
+    needs_initial_save = bool(missing) or len(df) < n_rows
+
+    # 타입 정리 (box는 0~5, mistake_count도 작은 정수 → int8/int16, SRS 배열과 같은 dtype)
+    df['mistake_count'] = df['mistake_count'].fillna(0).astype('int16')
+    df['box'] = df['box'].fillna(0).astype('int8')
+    df['next_review'] = df['next_review'].astype(str).replace(['nan', 'None'], '0000-00-00')
+    # FSRS 상태 (stability 0 = 아직 FSRS로 학습 안 한 카드)
+    for col in ('stability', 'difficulty'):
+        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0).astype('float32')
+    df['last_review'] = df['last_review'].astype(str).replace(['nan', 'None'], '0000-00-00')
+    # topic/pos는 종류가 적은 문자열 → 공백만 정리해서 category (대소문자는 화면 표시용으로 유지)
+    for col in ('topic', 'pos'):
+        if col in df.columns:
+            df[col] = df[col].fillna('').astype(str).str.strip().astype('category')
+
+    check_vocab_columns(df)
+
+    if needs_initial_save:
+        conn.update(worksheet=SHEET_MAIN, data=df)
+
+    return df, needs_initial_save
+
+
+def read_vocab_snapshot():
+    """VOCAB_SNAPSHOT_TTL 안에 저장된 로컬 Parquet 스냅샷이 있으면 읽음 (없거나 오래됐거나 깨졌으면 None, pyarrow 필요)"""
+    try:
+        if time.time() - os.path.getmtime(VOCAB_SNAPSHOT) > VOCAB_SNAPSHOT_TTL:
+            return None
+        df = pd.read_parquet(VOCAB_SNAPSHOT)
+        # 시트와 같은 검증 + 컬럼이 추가되기 전 버전이 남긴 스냅샷은 버림 (→ 시트에서 다시 읽음)
+        check_vocab_columns(df)
+        return df if all(c in df.columns for c in COLUMN_DEFAULTS) else None
+    except Exception:
+        return None
+
+
+def write_vocab_snapshot(df):
+    """read_vocab_sheet 결과를 Parquet으로 저장 (임시 파일 → rename). 실패해도 무시 (다음 기동 때 시트에서 읽음)"""
+    tmp_path = f"{VOCAB_SNAPSHOT}.{os.getpid()}.tmp"
     try:
-        df = conn.read(worksheet=SHEET_MAIN, ttl=0)
-        df.columns = df.columns.str.lower()
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, VOCAB_SNAPSHOT)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
 
-        # 중복 단어 제거
-        if 'word' in df.columns:
-            df = df.drop_duplicates(subset=['word'], keep='first')
+def drop_vocab_snapshot():
+    """시트의 SRS 값이 바뀌면 스냅샷은 낡은 것 → 삭제 (다음 콜드 스타트는 시트에서 읽음)"""
+    try:
+        os.remove(VOCAB_SNAPSHOT)
+    except OSError:
+        pass
 
-        needs_initial_save = False
 
-        # 기본 SRS 컬럼 보장
-        for col in ['mistake_count', 'box', 'next_review']:
-            if col not in df.columns:
-                if col in ['mistake_count', 'box']:
-                    df[col] = 0
-                else:
-                    df[col] = '0000-00-00'
-                needs_initial_save = True
-
-        # MCQ용 컬럼 보장
-        for col in ['example_blank', 'collocations', 'confusables']:
-            if col not in df.columns:
-                df[col] = ''
-                needs_initial_save = True
-
-        # 타입 정리
-        df['mistake_count'] = df['mistake_count'].fillna(0).astype(int)
-        df['box'] = df['box'].fillna(0).astype(int)
-        df['next_review'] = df['next_review'].astype(str).replace(['nan', 'None'], '0000-00-00')
-
-        # id 필수
-        if 'id' not in df.columns:
-            st.error("ERROR: 'id' column not found in Sheet1.")
-            st.stop()
+def load_data(use_snapshot=True):
+    """
+    vocab DataFrame 로드. 반환: (df, notices)
+    캐시된 get_vocab_store 안에서 불리므로 st.* 출력 X → 실패는 예외로, 안내 문구는 notices로 돌려줌
+    use_snapshot=False: 스냅샷 무시하고 시트에서 다시 읽음 (reload_vocab)
+    """
+    notices = []
+    # 최근 스냅샷이 있으면 시트 왕복 없이 시작
+    df = read_vocab_snapshot() if use_snapshot else None
+    if df is None:
+        df, restructured = read_vocab_sheet()
+        if restructured:
+            notices.append("Updated Google Sheet structure (added columns).")
+        write_vocab_snapshot(df)
+
+    # 리스트 컬럼 파싱 (문제 생성 때마다 literal_eval 하지 않도록)
+    for col in LIST_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].map(
+                lambda x: [v for v in parse_list(x) if isinstance(v, str) and v.strip()]
+            )
 
-        if needs_initial_save:
-            conn.update(worksheet=SHEET_MAIN, data=df)
-            st.toast("Updated Google Sheet structure (added columns).")
+    return df, notices
 
-        if df.empty:
-            st.warning("Google Sheet is empty.")
-            st.stop()
 
-        return df
+@st.cache_resource(show_spinner=False)
+def get_vocab_store():
+    """
+    프로세스 전체에서 공유하는 vocab 보관소 {df, id_to_pos, lock, notices} (세션마다 시트를 다시 읽거나 복사하지 않음).
+    세션별 SRS 변경은 session_state.srs 배열에 두고, 시트 저장이 성공한 값만 SRS writer가 df에 반영.
+    writer 스레드가 df를 고치는 동안 다른 세션이 반쯤 바뀐 행을 읽지 않도록 df 읽기/쓰기는 lock 안에서.
+    notices는 로드를 일으킨 세션이 꺼내서 한 번만 표시 (캐시 함수 안의 st.toast는 모든 세션에 재생됨)
+    """
+    df, notices = load_data()
+    return {"df": df, "id_to_pos": build_id_index(df), "lock": threading.RLock(), "version": 0,
+            "notices": notices}
 
-    except Exception as e:
-        st.error(f"Google Sheet Connection Error: {e}")
-        st.stop()
+
+def reload_vocab():
+    """
+    시트를 다시 읽어 공유 vocab 보관소의 df/id_to_pos를 교체 (앱 재시작 없이 시트 수정 반영).
+    쌓인 SRS 쓰기는 호출 전에 flush_srs로 먼저 저장해야 함 (안 그러면 최근 답안이 빠진 시트를 읽음).
+    version을 올려서 다른 세션도 setup 화면에서 세션 배열/풀을 다시 만들게 함. 반환: notices
+    """
+    store = get_vocab_store()
+    df, notices = load_data(use_snapshot=False)
+    if df.empty:
+        raise ValueError("Google Sheet is empty.")
+    id_to_pos = build_id_index(df)
+    writer = get_srs_writer()
+    layout = read_sheet_layout(writer["ws"])  # 시트에서 컬럼을 옮겼을 수도 있음
+    with store["lock"]:
+        store["df"] = df
+        store["id_to_pos"] = id_to_pos
+        store["version"] += 1
+    writer["layout"] = layout
+    return notices
+
+
+def vocab_lock():
+    """공유 vocab DataFrame lock (SRS 컬럼이 들어간 행을 읽을 때/바꿀 때)"""
+    return get_vocab_store()["lock"]
+
+
+def build_id_index(df):
+    """id -> 행 위치 dict. 답안마다 id 컬럼 전체를 스캔하지 않도록 로드 시 한 번 생성."""
+    return dict(zip(df['id'].astype(int).tolist(), range(len(df))))
+
+
+def optional_column(df, name, default=''):
+    """read_vocab_sheet가 없어도 허용하는 컬럼(topic/pos/synonyms 등): 없으면 default로 채운 Series"""
+    if name in df.columns:
+        return df[name]
+    return pd.Series([default] * len(df), index=df.index, dtype=object)
+
+
+def build_srs_arrays(df):
+    """
+    SRS 핫 컬럼을 연속 NumPy 배열(SoA)로 분리.
+    get_next_word/update_srs는 이 배열만 다루고, DataFrame은 시트 저장용으로만 동기화.
+    """
+    def epoch_days(col):
+        # 'YYYY-MM-DD' -> EPOCH 기준 일수 ('0000-00-00' 등 날짜가 아니면 0)
+        dates = pd.to_datetime(df[col], format='%Y-%m-%d', errors='coerce')
+        return (dates - pd.Timestamp(EPOCH)).dt.days.fillna(0).to_numpy(dtype=np.int32)
+
+    # topic은 정수 코드로 (문자열 object 비교 대신 int 비교), topic 컬럼이 없으면 전부 '' 한 종류
+    topic_codes, topic_names = pd.factorize(optional_column(df, 'topic'))  # 로드 시 이미 strip + category
+    box = df['box'].to_numpy(dtype=np.int8, copy=True)
+    next_review_i = epoch_days('next_review')
+    stability = df['stability'].to_numpy(dtype=np.float32, copy=True)
+    difficulty = df['difficulty'].to_numpy(dtype=np.float32, copy=True)
+    last_review_i = epoch_days('last_review')
+
+    # FSRS 도입 전(Leitner) 학습 기록은 이어받음 (srs.leitner_seed, 다음 답안 때 시트에 저장됨)
+    legacy = (stability <= 0) & (box > 0)
+    if legacy.any():
+        stability[legacy], difficulty[legacy], last_review_i[legacy] = leitner_seed(
+            box[legacy].astype(np.int32), next_review_i[legacy])
+
+    return {
+        'ids': df['id'].to_numpy(dtype=np.int64, copy=True),
+        # level 컬럼이 없으면 None → 난이도 필터 없이 전체
+        'level': (pd.to_numeric(df['level'], errors='coerce').fillna(0).to_numpy(dtype=np.int8)
+                  if 'level' in df.columns else None),
+        'topic': topic_codes.astype(np.int16),
+        'topic_index': {name: code for code, name in enumerate(topic_names)},
+        'box': box,
+        'mistakes': df['mistake_count'].to_numpy(dtype=np.int16, copy=True),
+        'next_review_i': next_review_i,
+        'stability': stability,
+        'difficulty': difficulty,
+        'last_review_i': last_review_i,
+    }
+
+
+def build_word_pools(df):
+    """
+    오답 보기용 풀을 로드 시 한 번 생성 → 문제마다 DataFrame 복사/필터/set/shuffle 안 함.
+    - blank: topic / (topic, pos) 별 unique 단어 tuple
+    - synonym: pos 별 synonyms 합집합 (+ 전체)
+    word/topic/pos/synonyms 컬럼이 없으면 빈 값으로 보고 해당 풀만 비움
+    """
+    words = pd.DataFrame({
+        'word': optional_column(df, 'word').fillna('').astype(str).str.strip(),
+        'topic': optional_column(df, 'topic').astype(str),
+        'pos': optional_column(df, 'pos').astype(str).str.lower(),
+    })
+    words = words[words['word'] != '']
+
+    syn_by_pos = {}
+    for pos, syns in zip(words['pos'], optional_column(df, 'synonyms', []).loc[words.index]):
+        syn_by_pos.setdefault(pos, set()).update(syns)
+
+    return {
+        'all_words': tuple(words['word'].unique()),
+        'syn_by_pos': {pos: tuple(v) for pos, v in syn_by_pos.items()},
+        'all_syns': tuple(set().union(*syn_by_pos.values())),
+        'topic_to_words': {t: tuple(g['word'].unique()) for t, g in words.groupby('topic')},
+        'topic_pos_to_words': {k: tuple(g['word'].unique()) for k, g in words.groupby(['topic', 'pos'])},
+    }
 
 
 def ensure_qc_sheet_and_header():
@@ -87,31 +348,37 @@ def ensure_qc_sheet_and_header():
     Streamlit-GSheets 환경에서 헤더 꼬임을 방어.
     """
     try:
-        df_old = conn.read(worksheet=QC_SHEET, ttl=0)
-
-        if df_old is None or df_old.empty or len(getattr(df_old, "columns", [])) == 0:
-            seed = {c: "" for c in QC_COLUMNS}
-            seed["ts"] = "__seed__"
-            df_init = pd.DataFrame([seed], columns=QC_COLUMNS)
-            conn.update(worksheet=QC_SHEET, data=df_init)
+        # 보통은 헤더 + seed row가 이미 맞음 → 위 2행만 읽고 끝 (로그 전체를 읽고 다시 쓰지 않음)
+        ws = get_worksheet(QC_SHEET)
+        top = ws.get(f"A1:{_col_letter(len(QC_COLUMNS) - 1)}2")
+        header = [str(h).strip().lower() for h in top[0]] if top else []
+        seed_ok = len(top) > 1 and bool(top[1]) and top[1][0] == "__seed__"
+        if header == QC_COLUMNS and seed_ok:
             return True
 
-        df_old.columns = df_old.columns.str.lower()
+        if not header:
+            seed = [""] * len(QC_COLUMNS)
+            seed[0] = "__seed__"
+            ws.update(range_name="A1", values=[QC_COLUMNS, seed], value_input_option="RAW")
+            return True
 
-        # 컬럼 동기화
-        missing = [c for c in QC_COLUMNS if c not in df_old.columns]
-        for c in missing:
-            df_old[c] = ""
+        # 헤더가 다르거나 seed가 없을 때만 기존 로그를 읽어서 재정렬 후 전체 재작성
+        df_old = conn.read(worksheet=QC_SHEET, ttl=0)
 
-        df_old = df_old[QC_COLUMNS]
+        df_old.columns = lower_columns(df_old.columns)
 
-        # seed row 보장
-        if not (df_old["ts"].astype(str) == "__seed__").any():
-            seed = {c: "" for c in QC_COLUMNS}
-            seed["ts"] = "__seed__"
-            df_old = pd.concat([pd.DataFrame([seed]), df_old], ignore_index=True)
+        # 컬럼 동기화 (없는 컬럼 추가 + 순서 맞춤을 reindex 한 번으로)
+        df_old = df_old.reindex(columns=QC_COLUMNS, fill_value="")
+        # 다른 위치에 있던 seed row는 빼고 맨 위에 하나만 둠
+        df_old = df_old[df_old["ts"].astype(str) != "__seed__"]
 
-        conn.update(worksheet=QC_SHEET, data=df_old)
+        # 헤더 + seed row는 values 앞에 바로 붙임 (seed DataFrame + concat으로 전체 복사 X)
+        seed = [""] * len(QC_COLUMNS)
+        seed[0] = "__seed__"
+        values = [QC_COLUMNS, seed]
+        values += [[_qc_cell(v) for v in row] for row in df_old.astype(object).values.tolist()]
+        ws.clear()
+        ws.update(range_name="A1", values=values, value_input_option="RAW")
         return True
 
     except Exception:
@@ -120,83 +387,155 @@ def ensure_qc_sheet_and_header():
         return False
 
 
-def append_qc_log(rows):
-    """
-    rows: list[dict]
-    - seed row 제거 후 append, 맨 위에 seed 재삽입
-    - llm_selected/llm_is_correct는 절대 빈값 방지
-    """
-    if not rows:
-        return
-    if not ensure_qc_sheet_and_header():
-        return
-
-    try:
-        df_old = conn.read(worksheet=QC_SHEET, ttl=0)
-        if df_old is None or len(getattr(df_old, "columns", [])) == 0:
-            df_old = pd.DataFrame(columns=QC_COLUMNS)
-
-        df_old.columns = df_old.columns.str.lower()
+def get_worksheet(name):
+    """streamlit_gsheets 내부의 gspread Worksheet (append/부분 쓰기용)."""
+    return conn.client._select_worksheet(worksheet=name)
 
-        df_new = pd.DataFrame(rows)
-        if df_new is None or df_new.empty:
-            return
-        df_new.columns = df_new.columns.str.lower()
 
-        # 컬럼 보정
-        for c in QC_COLUMNS:
-            if c not in df_old.columns:
-                df_old[c] = ""
-            if c not in df_new.columns:
-                df_new[c] = ""
+def _qc_cell(v):
+    """values.append용 셀 값: None/NaN은 빈칸(기존 fillna("") 대체), 숫자는 그대로."""
+    if v is None or (isinstance(v, float) and v != v):
+        return ""
+    if isinstance(v, (str, int, float)):
+        return v
+    return str(v)
 
-        df_old = df_old[QC_COLUMNS]
-        df_new = df_new[QC_COLUMNS]
 
-        # seed row 제거
-        df_old = df_old[df_old["ts"].astype(str) != "__seed__"]
+@st.cache_resource(show_spinner=False)
+def get_qc_store():
+    """
+    프로세스당 하나인 QC 로그 로컬 outbox (SQLite, WAL).
+    append는 로컬 INSERT만 하고 바로 리턴 → 시트 지연/쿼터에 막히지 않음.
+    백그라운드 스레드가 outbox 행을 append 직후 또는 QC_SYNC_INTERVAL초마다 values.append로 QC_Log에 옮기고,
+    옮긴 행은 outbox에서 삭제 (테이블에는 아직 못 보낸 행만 있음).
+    (스레드 안에서는 st.* 호출 X, 에러는 last_error에 남겨서 append_qc_rows가 표시)
+    """
+    db = sqlite3.connect(QC_LOCAL_DB, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("CREATE TABLE IF NOT EXISTS qc_log (id INTEGER PRIMARY KEY, row TEXT NOT NULL)")
+    db.commit()
+
+    store = {
+        "db": db,
+        "lock": threading.Lock(),       # sqlite 연결 공유용
+        "sync_lock": threading.Lock(),  # 동기화가 겹쳐서 같은 행을 두 번 보내지 않도록
+        "wake": threading.Event(),
+        "ws": get_worksheet(QC_SHEET),
+        "last_error": None,
+    }
+    threading.Thread(target=_qc_sync_loop, args=(store,), daemon=True, name="qc-sync").start()
+    # 서버 종료 시 남은 행 전송 시도 (못 보낸 행은 파일에 남아 다음 프로세스의 첫 세션에서 전송)
+    atexit.register(_sync_qc_store, store)
+    return store
+
+
+def _sync_qc_store(store):
+    """outbox 행을 QC_SYNC_BATCH개씩 append_rows로 전송하고, 성공한 것만 outbox에서 삭제."""
+    with store["sync_lock"]:
+        while True:
+            with store["lock"]:
+                rows = store["db"].execute(
+                    "SELECT id, row FROM qc_log ORDER BY id LIMIT ?", (QC_SYNC_BATCH,)
+                ).fetchall()
+            if not rows:
+                return
 
-        # llm 컬럼 비면 강제 채움
-        def _fill_llm(row_dict):
-            opt_list = []
             try:
-                opt_list = json.loads(row_dict.get("options", "[]"))
-            except Exception:
-                opt_list = []
+                store["ws"].append_rows([json.loads(r) for _, r in rows],
+                                        value_input_option="RAW", insert_data_option="INSERT_ROWS")
+            except Exception as e:
+                store["last_error"] = e  # outbox에 남김 → 다음 주기에 재전송
+                return
 
-            if not str(row_dict.get("llm_selected", "")).strip():
-                row_dict["llm_selected"] = opt_list[0] if opt_list else ""
+            with store["lock"]:
+                store["db"].execute("DELETE FROM qc_log WHERE id <= ?", (rows[-1][0],))
+                store["db"].commit()
+            store["last_error"] = None
 
-            if not str(row_dict.get("llm_is_correct", "")).strip():
-                try:
-                    ca = set(json.loads(row_dict.get("correct_answers", "[]")))
-                except Exception:
-                    ca = set()
-                row_dict["llm_is_correct"] = "TRUE" if (row_dict["llm_selected"] in ca) else "FALSE"
 
-            return row_dict
+def _qc_sync_loop(store):
+    while True:
+        store["wake"].wait(QC_SYNC_INTERVAL)
+        store["wake"].clear()
+        _sync_qc_store(store)
 
-        df_new = df_new.apply(lambda r: pd.Series(_fill_llm(r.to_dict())), axis=1)
 
-        merged = pd.concat([df_old, df_new], ignore_index=True)
-        merged = merged.fillna("")
+def append_qc_rows(values):
+    """
+    values: list[list] (QC_COLUMNS 순서, 이미 채워진 셀 값, llm_selected/llm_is_correct 포함)
+    새 행만 로컬 outbox에 INSERT 후 동기화 깨움 (시트는 동기화 스레드가 values.append로 전송).
+    반환: outbox에 넣었으면 True (시트 전송은 아직일 수 있음)
+    """
+    if not values:
+        return False
 
-        # seed row 다시 삽입
-        seed = {c: "" for c in QC_COLUMNS}
-        seed["ts"] = "__seed__"
-        merged = pd.concat([pd.DataFrame([seed]), merged], ignore_index=True)
+    if not st.session_state.get("_qc_ensured"):
+        if not ensure_qc_sheet_and_header():
+            return False
+        st.session_state._qc_ensured = True
 
-        conn.update(worksheet=QC_SHEET, data=merged)
+    store = get_qc_store()
+    with store["lock"]:
+        store["db"].executemany("INSERT INTO qc_log (row) VALUES (?)",
+                                [(json_dumps(v),) for v in values])
+        store["db"].commit()
+    store["wake"].set()
 
-    except Exception as e:
-        st.error(f"QC_Log append failed: {e}")
+    if store["last_error"] is not None:
+        # 스키마가 꼬였을 수 있으니 다음 append에서 헤더를 다시 확인 (행은 outbox에 남아 재전송)
+        st.session_state._qc_ensured = False
+        st.error(f"QC_Log sync failed: {store['last_error']}")
+    return True
 
 
 # =========================================================
 # 2) Session State
 # =========================================================
+# 다른 세션이 vocab을 다시 읽었으면 세션 배열/풀도 새 df로 (퀴즈 중에는 끝날 때까지 기존 것 유지)
+if ('vocab_db' in st.session_state and st.session_state.get('app_mode') != 'quiz'
+        and st.session_state.vocab_version != get_vocab_store()["version"]):
+    for key in VOCAB_SESSION_KEYS:
+        st.session_state.pop(key, None)
 if 'vocab_db' not in st.session_state:
-    st.session_state.vocab_db = load_data()
+    try:
+        vocab = get_vocab_store()
+    except ValueError as e:  # 시트 구조 문제 ('id' 컬럼 없음 등)
+        st.error(str(e))
+        st.stop()
+    except Exception as e:
+        st.error(f"Google Sheet Connection Error: {e}")
+        st.stop()
+    while vocab["notices"]:
+        st.toast(vocab["notices"].pop(0))
+    if vocab["df"].empty:
+        st.warning("Google Sheet is empty.")
+        st.stop()
+    st.session_state.vocab_db = vocab["df"]  # 공유 객체 참조 (복사 X)
+    st.session_state.vocab_version = vocab["version"]
+if 'id_to_idx' not in st.session_state:
+    st.session_state.id_to_idx = get_vocab_store()["id_to_pos"]  # 읽기 전용으로 공유
+if 'srs' not in st.session_state:
+    with vocab_lock():  # writer가 SRS 컬럼을 고치는 중이면 끝난 뒤에 복사
+        st.session_state.srs = build_srs_arrays(st.session_state.vocab_db)
+if 'word_pools' not in st.session_state:
+    st.session_state.word_pools = build_word_pools(st.session_state.vocab_db)
+if 'rng' not in st.session_state:
+    st.session_state.rng = np.random.default_rng()  # 세션별 Generator (스레드 간 공유 X)
+# SRS writer는 첫 답안이 아니라 세션 시작 때 만듦 (헤더/id 컬럼 읽기 실패를 미리 알림)
+if '_srs_writer_checked' not in st.session_state:
+    st.session_state._srs_writer_checked = True
+    try:
+        get_srs_writer()
+    except Exception as e:
+        st.warning(f"Progress saving is unavailable: {e}")
+# 이전 프로세스가 못 보낸 QC 행이 있을 수 있으니 QC 실행을 기다리지 않고 동기화 스레드 시작 (세션당 한 번 확인, 스토어는 프로세스당 하나)
+if '_qc_outbox_checked' not in st.session_state:
+    st.session_state._qc_outbox_checked = True
+    if os.path.exists(QC_LOCAL_DB):
+        try:
+            get_qc_store()
+        except Exception:
+            pass  # QC_Log 탭이 없는 등 → 다음 QC 실행 때 다시 시도
 
 if 'app_mode' not in st.session_state:
     st.session_state.app_mode = 'setup'
@@ -216,7 +555,7 @@ if 'selected_option' not in st.session_state:
 if 'question_type' not in st.session_state:
     st.session_state.question_type = None
 if 'correct_answers' not in st.session_state:
-    st.session_state.correct_answers = set()
+    st.session_state.correct_answers = frozenset()
 if 'question_text' not in st.session_state:
     st.session_state.question_text = ""
 if 'example_blank_to_show' not in st.session_state:
@@ -226,73 +565,399 @@ if 'example_blank_to_show' not in st.session_state:
 # =========================================================
 # 3) Core Logic
 # =========================================================
-def get_next_word():
-    df = st.session_state.vocab_db
-    config = st.session_state.session_config
+def base_candidates(topic, lo, hi):
+    """
+    (topic, 난이도 범위)로만 정해지는 후보 행 위치 배열.
+    세션 설정 동안 바뀌지 않으므로 session_state에 캐시하고, 매 문제는 due/오답 조건만 다시 계산.
+    """
+    cache = st.session_state.setdefault('base_candidates', {})
+    key = (topic, int(lo), int(hi))
+    if key not in cache:
+        S = st.session_state.srs
+        if S['level'] is None:
+            mask = np.ones(len(S['ids']), dtype=bool)
+        else:
+            mask = (S['level'] >= lo) & (S['level'] <= hi)
+        if topic != "All":
+            mask &= (S['topic'] == S['topic_index'].get(topic, -1))
+        cache[key] = np.flatnonzero(mask)
+    return cache[key]
+
+
+def candidate_positions(base, box, mistakes, next_review_i, today_i, review_mode):
+    """
+    base 위치 중 지금 출제 가능한 위치만 반환 (순수 배열 연산, session_state 의존 없음).
+    review_mode: box==0 & mistakes>0 / 아니면 next_review_i <= today_i
+    """
+    if review_mode:
+        keep = (box[base] == 0) & (mistakes[base] > 0)
+    else:
+        keep = next_review_i[base] <= today_i
+    return base[keep]
+
 
+def _candidate_key():
+    """(topic, lo, hi, review_mode, today_i): 후보 집합을 정하는 설정 + 오늘 날짜"""
+    config = st.session_state.session_config
     difficulty = config.get('difficulty', (1, 3))
-    mask = (df['level'] >= difficulty[0]) & (df['level'] <= difficulty[1])
+    review_mode = config.get('mode', 'Standard Study (SRS)') == 'Review Mistakes Only'
+    today_i = (datetime.date.today() - EPOCH).days
+    return config.get('topic', 'All'), int(difficulty[0]), int(difficulty[1]), review_mode, today_i
 
-    topic = config.get('topic', 'All')
-    if topic != "All":
-        mask = mask & (df['topic'] == topic)
 
-    mode = config.get('mode', 'Standard Study (SRS)')
-    today_str = str(datetime.date.today())
+def current_candidates():
+    """현재 session_config 기준으로 지금 출제 가능한 행 위치 배열"""
+    S = st.session_state.srs
+    topic, lo, hi, review_mode, today_i = _candidate_key()
+    base = base_candidates(topic, lo, hi)
+    return candidate_positions(base, S['box'], S['mistakes'], S['next_review_i'], today_i, review_mode)
 
-    if mode == 'Review Mistakes Only':
-        logic_mask = (df['box'] == 0) & (df['mistake_count'] > 0)
-        if df[mask & logic_mask].empty:
-            st.toast("No historical mistakes found! (Box 0 & Count > 0)")
-    else:
-        logic_mask = df['next_review'] <= today_str
 
-    candidates = df[mask & logic_mask]
-    if len(candidates) == 0:
+def candidate_pool():
+    """
+    출제 가능 위치 목록을 (설정, 날짜)별로 한 번만 계산해서 session_state에 두고,
+    답할 때마다 refresh_candidate로 그 위치만 넣고/빼서 유지 (매 문제 전체 마스크 재계산 X).
+    items(list) + where({위치: items 인덱스}) → 추가/삭제/랜덤 선택 모두 O(1)
+    base(정렬된 level/topic 위치 배열)는 refresh_candidate의 소속 확인용
+    """
+    key = _candidate_key()
+    pool = st.session_state.get('candidate_pool')
+    if pool is None or pool['key'] != key:
+        items = current_candidates().tolist()
+        pool = {'key': key, 'base': base_candidates(*key[:3]),
+                'items': items, 'where': {p: i for i, p in enumerate(items)}}
+        st.session_state.candidate_pool = pool
+    return pool
+
+
+def refresh_candidate(idx):
+    """update_srs 후 idx 한 위치만 다시 판정해서 candidate_pool에 반영 (pool의 base에 속한 위치만)"""
+    pool = st.session_state.get('candidate_pool')
+    if pool is None:
+        return
+
+    # level/topic 설정 밖의 위치는 출제 대상이 아님 (base는 flatnonzero 결과라 정렬돼 있음)
+    base = pool['base']
+    i = int(np.searchsorted(base, idx))
+    if i == len(base) or base[i] != idx:
+        return
+
+    S = st.session_state.srs
+    _, _, _, review_mode, today_i = pool['key']
+    eligible = len(candidate_positions(np.array([idx]), S['box'], S['mistakes'], S['next_review_i'],
+                                       today_i, review_mode)) > 0
+    items, where = pool['items'], pool['where']
+    if eligible and idx not in where:
+        where[idx] = len(items)
+        items.append(idx)
+    elif not eligible and idx in where:
+        # 마지막 원소를 빈 자리로 옮기고 pop
+        i = where.pop(idx)
+        last = items.pop()
+        if last != idx:
+            items[i] = last
+            where[last] = i
+
+
+def get_next_word():
+    S = st.session_state.srs
+    items = candidate_pool()['items']
+    if not items:
+        if st.session_state.session_config.get('mode') == 'Review Mistakes Only':
+            st.toast("No historical mistakes found! (Box 0 & Count > 0)")
         return None
 
-    selected = candidates.sample(1).iloc[0]
-    return selected['id']
+    return int(S['ids'][items[st.session_state.rng.integers(len(items))]])
 
 
 def update_srs(word_id, is_correct):
-    df = st.session_state.vocab_db
-    idx_list = df[df['id'] == word_id].index.tolist()
-    if not idx_list:
+    S = st.session_state.srs
+    idx = st.session_state.id_to_idx.get(int(word_id))
+    if idx is None:
         return
-    idx = idx_list[0]
-
-    current_box = int(df.at[idx, 'box'])
-    current_mistakes = int(df.at[idx, 'mistake_count'])
 
-    if is_correct:
-        st.session_state.session_stats['correct'] += 1
-        new_box = min(current_box + 1, 5)
-        days_to_add = int(2 ** new_box)
-        new_mistakes = current_mistakes
-    else:
-        st.session_state.session_stats['wrong'] += 1
-        new_box = 0
-        days_to_add = 0
-        new_mistakes = current_mistakes + 1
+    today = datetime.date.today()
+    today_i = (today - EPOCH).days
+    last_i = int(S['last_review_i'][idx])
+    new_box, new_mistakes = srs_step(int(S['box'][idx]), int(S['mistakes'][idx]), is_correct)
+    new_s, new_d, days_to_add = fsrs_step(float(S['stability'][idx]), float(S['difficulty'][idx]),
+                                          today_i - last_i if last_i > 0 else 0, is_correct)
+    new_s, new_d = round(new_s, 4), round(new_d, 4)
 
+    st.session_state.session_stats['correct' if is_correct else 'wrong'] += 1
     st.session_state.session_stats['total'] += 1
-    next_date = datetime.date.today() + datetime.timedelta(days=days_to_add)
+    next_date = today + SRS_DAY_DELTAS[days_to_add]
+
+    # 시트 + 공유 DataFrame은 writer 스레드가 모아서 저장. 큐에 못 넣으면 세션 배열도 그대로 둠
+    try:
+        writer = get_srs_writer()
+        writer["queue"].put_nowait(
+            (int(word_id), {'box': new_box, 'next_review': str(next_date), 'mistake_count': new_mistakes,
+                            'stability': new_s, 'difficulty': new_d, 'last_review': str(today)})
+        )
+    except Exception as e:
+        st.error(f"Save failed: {e}")
+        return
+    if writer["last_error"] is not None:
+        st.error(f"Save failed: {writer['last_error']}")
+
+    S['box'][idx] = new_box
+    S['mistakes'][idx] = new_mistakes
+    S['next_review_i'][idx] = today_i + days_to_add
+    S['stability'][idx] = new_s
+    S['difficulty'][idx] = new_d
+    S['last_review_i'][idx] = today_i
+    refresh_candidate(idx)
+
+
+def _col_letter(n):
+    """0-based 컬럼 위치 -> A1 표기 컬럼 문자 (0 -> A, 26 -> AA)"""
+    letters = ""
+    n += 1
+    while n:
+        n, r = divmod(n - 1, 26)
+        letters = chr(65 + r) + letters
+    return letters
+
+
+@st.cache_resource(show_spinner=False)
+def get_srs_writer():
+    """
+    프로세스당 하나인 SRS write-behind 스레드.
+    update_srs는 queue에 (word id, {컬럼: 값})만 넣고 바로 리턴 → 답안 클릭이 시트 왕복을 기다리지 않음.
+    스레드는 같은 id를 합쳐서 SRS_FLUSH_INTERVAL초 또는 SRS_FLUSH_MAX행마다 batchUpdate 한 번.
+    (스레드 안에서는 st.* 호출 X, 에러는 last_error에 남겨서 flush_srs가 표시)
+    """
+    ws = get_worksheet(SHEET_MAIN)
+    layout = read_sheet_layout(ws)
+    read_sheet_rows(ws, layout["id_col"])  # id 컬럼을 읽을 수 있는지 시작 때 확인
+    writer = {
+        "queue": queue.Queue(),
+        "ws": ws,
+        "store": get_vocab_store(),
+        "layout": layout,
+        "last_error": None,
+    }
+    threading.Thread(target=_srs_writer_loop, args=(writer,), daemon=True, name="srs-writer").start()
+    # 서버 종료 시 daemon 스레드와 함께 버려지지 않도록 남은 쓰기 저장
+    atexit.register(_drain_srs_writer, writer)
+    return writer
+
+
+def read_sheet_layout(ws):
+    """
+    시트 헤더에서 SRS 컬럼 위치를 읽음 (DataFrame이 아니라 실제 시트 기준).
+    반환: {"id_col": id 컬럼 번호(1-based), "letters": {컬럼: A1 문자}, "runs": 붙어 있는 컬럼 묶음}
+    """
+    header = [str(c).strip().lower() for c in ws.row_values(1)]
+    missing = [col for col in ('id',) + SRS_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"ERROR: {missing} column(s) not found in {SHEET_MAIN} header.")
+    positions = {col: header.index(col) for col in SRS_COLUMNS}
+    # 붙어 있는 컬럼끼리 묶음 (시트 끝에 추가된 FSRS 컬럼은 보통 따로 한 묶음)
+    cols = sorted(positions, key=positions.get)
+    runs = [[cols[0]]]
+    for col in cols[1:]:
+        if positions[col] == positions[runs[-1][-1]] + 1:
+            runs[-1].append(col)
+        else:
+            runs.append([col])
+    return {
+        "id_col": header.index('id') + 1,  # gspread col_values는 1-based
+        "letters": {col: _col_letter(pos) for col, pos in positions.items()},
+        # 행 전체(SRS_COLUMNS)를 쓸 때는 묶음마다 range 하나(H5:J5)로 보냄
+        "runs": runs,
+    }
 
-    st.session_state.vocab_db.at[idx, 'box'] = new_box
-    st.session_state.vocab_db.at[idx, 'next_review'] = str(next_date)
-    st.session_state.vocab_db.at[idx, 'mistake_count'] = new_mistakes
 
+def read_sheet_rows(ws, id_col):
+    """
+    시트 id 컬럼을 읽어서 ({id: 시트 행 번호}, 마지막 행 번호).
+    쓰기 직전마다 다시 읽음 → 시트에서 행을 지우거나 정렬/삽입해도 다른 단어 행에 쓰지 않음
+    """
+    values = ws.col_values(id_col)
+    rows = {}
+    for row, v in enumerate(values[1:], start=2):
+        try:
+            rows[int(float(v))] = row
+        except (TypeError, ValueError):
+            continue  # 빈 칸/잘못된 id 행은 건너뜀
+    return rows, len(values)
+
+
+def _drain_srs_writer(writer, timeout=10):
+    """writer에 flush 요청을 넣고 끝날 때까지(최대 timeout초) 대기. st.* 호출 X (atexit에서도 사용). 끝났으면 True."""
+    done = threading.Event()
+    writer["queue"].put(done)
+    return done.wait(timeout)
+
+
+def _srs_write(writer, pending):
+    """
+    pending {word id: {컬럼: 값}} 셀들을 batchUpdate 한 번으로 저장하고, 성공하면 공유 DataFrame에 반영.
+    시트 행은 방금 읽은 id 컬럼으로 찾음. 시트에 없는 id는 쓰지 않고 last_error로 알림
+    """
+    store = writer["store"]
+    layout = writer["layout"]  # reload_vocab이 통째로 바꿀 수 있으므로 한 번만 꺼냄
+    letters = layout["letters"]
+    runs = layout["runs"]
+    rows, _ = read_sheet_rows(writer["ws"], layout["id_col"])
+    data = []
+    missing = []
+    for word_id, cells in pending.items():
+        row = rows.get(word_id)
+        if row is None:
+            missing.append(word_id)
+            continue
+        if len(cells) == len(SRS_COLUMNS):
+            data.extend({"range": f"{letters[run[0]]}{row}:{letters[run[-1]]}{row}",
+                         "values": [[cells[col] for col in run]]} for run in runs)
+        else:
+            data.extend({"range": f"{letters[col]}{row}", "values": [[value]]} for col, value in cells.items())
+
+    if data:
+        writer["ws"].batch_update(data, value_input_option="RAW")
+        drop_vocab_snapshot()
+
+    with store["lock"]:  # 읽는 쪽(새 세션 배열 생성, QC 샘플링 등)이 반쯤 바뀐 행을 보지 않도록
+        df, id_to_pos = store["df"], store["id_to_pos"]
+        for word_id, cells in pending.items():
+            pos = id_to_pos.get(word_id)
+            if word_id in rows and pos is not None:
+                for col, value in cells.items():
+                    df.at[pos, col] = value
+
+    if missing:
+        # 재시도해도 행이 생기지 않으므로 pending에서는 빼고 알림만
+        raise LookupError(f"ids not found in {SHEET_MAIN}, not saved: {missing[:10]}")
+
+
+def _srs_writer_loop(writer):
+    q = writer["queue"]
+    pending = {}
+    deadline = None
+    failures = 0
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = q.get(timeout=timeout)
+        except queue.Empty:
+            item = None
+
+        waiter = None
+        if isinstance(item, threading.Event):
+            waiter = item  # flush_srs: 지금 저장하고 알려달라는 요청
+        elif item is not None:
+            word_id, cells = item
+            pending.setdefault(word_id, {}).update(cells)  # 같은 id는 마지막 값만
+            if deadline is None:
+                deadline = time.monotonic() + SRS_FLUSH_INTERVAL
+
+        if pending and (item is None or waiter is not None or len(pending) >= SRS_FLUSH_MAX):
+            try:
+                _srs_write(writer, pending)
+                pending = {}
+                failures = 0
+                writer["last_error"] = None
+            except LookupError as e:
+                pending = {}  # 시트에 없는 id만 못 씀 (나머지는 저장됨)
+                failures = 0
+                writer["last_error"] = e
+            except Exception as e:
+                failures += 1
+                if failures < SRS_WRITE_RETRIES:
+                    writer["last_error"] = e  # pending 유지 → 다음 주기에 재시도
+                else:
+                    writer["last_error"] = RuntimeError(
+                        f"gave up after {failures} attempts, {len(pending)} word(s) not saved: {e}")
+                    pending = {}
+                    failures = 0
+            deadline = time.monotonic() + SRS_FLUSH_INTERVAL if pending else None
+
+        if waiter is not None:
+            waiter.set()
+
+
+def flush_srs(timeout=10):
+    """
+    쌓여 있는 SRS 쓰기를 지금 저장하고 끝날 때까지(최대 timeout초) 대기.
+    세션 종료/화면 전환 시 호출. 실패하면 스레드가 다음 주기에 재시도 (SRS_WRITE_RETRIES번까지).
+    반환: timeout 안에 오류 없이 다 저장했으면 True
+    """
     try:
-        conn.update(worksheet=SHEET_MAIN, data=st.session_state.vocab_db)
+        writer = get_srs_writer()
     except Exception as e:
         st.error(f"Save failed: {e}")
+        return False
+    if not _drain_srs_writer(writer, timeout):
+        st.error("Save is taking too long; pending progress will be retried in the background.")
+        return False
+    if writer["last_error"] is not None:
+        st.error(f"Save failed: {writer['last_error']}")
+        return False
+    return True
+
+
+def synth_mp3(word: str, lang: str = "en") -> bytes:
+    """gTTS로 MP3 bytes 생성 (st.* 호출 X → 백그라운드 스레드에서도 사용)"""
+    from gtts import gTTS  # 퀴즈 화면에서 처음 필요할 때만 import (콜드 스타트 단축)
+
+    sound_file = BytesIO()
+    gTTS(text=word, lang=lang).write_to_fp(sound_file)
+    return sound_file.getvalue()
+
+
+@st.cache_data(max_entries=2048, show_spinner=False)
+def tts_bytes(word: str, lang: str = "en") -> bytes:
+    """단어 발음 MP3. rerun마다 gTTS 네트워크 호출하지 않도록 (word, lang)별 캐시."""
+    return synth_mp3(word, lang)
+
+
+@st.cache_resource(show_spinner=False)
+def get_tts_executor():
+    """TTS 미리 생성용 프로세스 공유 스레드 풀"""
+    return ThreadPoolExecutor(max_workers=TTS_PREFETCH_WORKERS, thread_name_prefix="tts")
+
+
+def prefetch_tts(words):
+    """
+    words 발음을 백그라운드에서 미리 생성해 session_state.tts_prefetch에 채움 (기다리지 않고 바로 리턴).
+    tts_bytes를 거쳐 생성하므로 프로세스 공용 캐시에도 남음 (다른 세션은 다시 받지 않음).
+    스레드는 session_state 자체가 아니라 그 안의 일반 dict에만 씀.
+    """
+    store = st.session_state.setdefault('tts_prefetch', {})
+
+    def _fetch(word):
+        try:
+            store[word] = tts_bytes(word)
+        except Exception:
+            pass  # 실패하면 퀴즈 화면에서 tts_bytes로 다시 시도
+
+    executor = get_tts_executor()
+    for word in dict.fromkeys(words):
+        if word and word not in store:
+            executor.submit(_fetch, word)
+
+
+# "['a', "b"]" 같은 단순 리스트 문자열 fast path (이스케이프 없는 경우만, 나머지는 ast로)
+_LIST_ITEM = r"'[^'\\]*'" + r'|"[^"\\]*"'
+_LIST_RE = re.compile(r"^\s*\[\s*(?:(?:" + _LIST_ITEM + r")\s*(?:,\s*(?:" + _LIST_ITEM + r")\s*)*,?\s*)?\]\s*$")
+_LIST_ITEM_RE = re.compile(r"'([^'\\]*)'" + r'|"([^"\\]*)"')
 
 
 def parse_list(x):
     if isinstance(x, list):
         return x
     if isinstance(x, str) and x.strip() != "":
+        if _LIST_RE.match(x):
+            return [a or b for a, b in _LIST_ITEM_RE.findall(x)]
+        # 이스케이프 등으로 정규식에 안 맞는 JSON 리스트는 json.loads (ast보다 훨씬 빠름)
+        try:
+            v = json.loads(x)
+            if isinstance(v, list):
+                return v
+        except ValueError:
+            pass
         try:
             v = ast.literal_eval(x)
             if isinstance(v, list):
@@ -303,32 +968,34 @@ def parse_list(x):
     return []
 
 
-def build_question_for_word(word_row, df_all):
-    # word_row: dict(시뮬) 또는 Series(퀴즈)
-    def _get(key, default=""):
-        if isinstance(word_row, dict):
-            return word_row.get(key, default)
-        return word_row.get(key, default)
+def question_shell(word_row, qtype):
+    """
+    문제에서 랜덤이 아닌 부분:
+      (qtype, question_text, correct(tuple), fixed_options(tuple), wrong_pool(tuple), example_blank)
+    wrong_pool은 공유 풀 그대로라 정답/보기가 섞여 있을 수 있음 → sample_excluding으로 뽑기.
+    (word_id, 요청 qtype)별로 session_state에 캐시 → 같은 단어 재출제/QC 반복 시 풀 필터링 생략.
+    qtype은 데이터 사정에 따라 바뀔 수 있음 (blank 불가 → synonym, synonyms 없음 → blank)
+    """
+    cache = st.session_state.setdefault('question_shells', {})
+    key = (int(word_row.get('id')), qtype)
+    if key in cache:
+        return cache[key]
 
-    new_id = int(_get('id'))
-    word_text = str(_get('word', '')).strip()
-    target_pos = str(_get('pos', '')).strip().lower()
-    target_topic = str(_get('topic', '')).strip()
+    pools = st.session_state.word_pools
+    word_text = str(word_row.get('word', '')).strip()
+    target_pos = str(word_row.get('pos', '')).strip().lower()
+    target_topic = str(word_row.get('topic', '')).strip()
 
-    example_blank = str(_get('example_blank', '')).strip()
+    example_blank = str(word_row.get('example_blank', '')).strip()
     can_blank = (example_blank != "" and example_blank.lower() not in ['nan', 'none'])
 
-    qtype = random.choice(['synonym', 'blank'])
     if qtype == 'blank' and not can_blank:
         qtype = 'synonym'
 
-    df_pool = df_all.copy()
-    df_pool['pos_norm'] = df_pool['pos'].fillna('').astype(str).str.strip().str.lower()
-
     # [A] Synonym
     if qtype == 'synonym':
-        synonyms = parse_list(_get('synonyms', ''))
-        synonyms = [s for s in synonyms if isinstance(s, str) and s.strip() != ""]
+        # LIST_COLUMNS는 load_data에서 이미 빈 값 없는 list[str]로 파싱됨
+        synonyms = parse_list(word_row.get('synonyms', ''))
         if not synonyms:
             if can_blank:
                 qtype = 'blank'
@@ -336,70 +1003,77 @@ def build_question_for_word(word_row, df_all):
                 synonyms = [word_text]
 
         if qtype == 'synonym':
-            question_text = f"### What is a synonym for: **{word_text}**?"
-            correct_set = set(synonyms)
-
-            correct_option = random.choice(list(correct_set))
-            options = [correct_option]
+            correct = tuple(dict.fromkeys(synonyms))
 
-            if target_pos and target_pos != 'nan':
-                candidate_df = df_pool[(df_pool['pos_norm'] == target_pos) & (df_pool['id'] != new_id)]
-                if candidate_df.empty:
-                    candidate_df = df_pool[df_pool['id'] != new_id]
-            else:
-                candidate_df = df_pool[df_pool['id'] != new_id]
-
-            wrong_pool = []
-            for syn_list in candidate_df['synonyms']:
-                for w in parse_list(syn_list):
-                    if isinstance(w, str) and w.strip():
-                        wrong_pool.append(w)
-
-            wrong_pool = list(set([w for w in wrong_pool if w and w not in correct_set]))
-            needed = 3
-            if len(wrong_pool) >= needed:
-                wrong_options = random.sample(wrong_pool, needed)
-            else:
-                defaults = ["Option A", "Option B", "Option C"]
-                wrong_options = wrong_pool + defaults[:needed - len(wrong_pool)]
+            # 같은 pos의 synonyms 풀(로드 시 만든 tuple 그대로, 정답 제외는 뽑을 때)
+            # 정답 말고 남는 게 없으면 전체 풀. len(pool) > len(correct)면 스캔 없이 남는 게 있음
+            wrong_pool = pools['syn_by_pos'].get(target_pos, ()) if target_pos else ()
+            if len(wrong_pool) <= len(correct) and all(w in correct for w in wrong_pool):
+                wrong_pool = pools['all_syns']
 
-            options += wrong_options
-            random.shuffle(options)
-
-            return qtype, question_text, options, correct_set, {'example_blank': ''}
+            shell = (qtype, f"### What is a synonym for: **{word_text}**?", correct, (), wrong_pool, '')
+            cache[key] = shell
+            return shell
 
     # [B] Blank
-    question_text = "### Fill in the blank with the best word:"
-    correct_set = {word_text}
-
-    confusables = parse_list(_get('confusables', ''))
-    confusables = [c for c in confusables if isinstance(c, str) and c.strip() and c != word_text]
+    confusables = [c for c in parse_list(word_row.get('confusables', '')) if c != word_text]
 
-    options = [word_text]
+    fixed = [word_text]
     for c in confusables:
-        if len(options) >= 4:
+        if len(fixed) >= 4:
             break
-        if c not in options:
-            options.append(c)
+        if c not in fixed:
+            fixed.append(c)
 
-    if len(options) < 4:
-        cand = df_pool[df_pool['id'] != new_id]
+    # 오답 풀도 공유 tuple 그대로 (fixed 제외는 sample_excluding으로 뽑을 때)
+    wrong_pool = ()
+    if len(fixed) < 4:
+        wrong_pool = pools['all_words']
         if target_topic:
-            cand = cand[cand['topic'] == target_topic]
+            wrong_pool = pools['topic_to_words'].get(target_topic, wrong_pool)
         if target_pos and target_pos != 'nan':
-            cand_pos = cand[cand['pos_norm'] == target_pos]
-            if not cand_pos.empty:
-                cand = cand_pos
+            pool_pos = pools['topic_pos_to_words'].get((target_topic, target_pos))
+            # 풀 안 단어는 unique → 2개 이상이면 자기 자신 말고 하나는 있음
+            if pool_pos and (len(pool_pos) > 1 or pool_pos[0] != word_text):
+                wrong_pool = pool_pos
 
-        filler = cand['word'].dropna().astype(str).tolist()
-        filler = [w for w in list(set(filler)) if w != word_text and w.strip()]
-        random.shuffle(filler)
+    shell = ('blank', "### Fill in the blank with the best word:", (word_text,), tuple(fixed), wrong_pool,
+             example_blank)
+    cache[key] = shell
+    return shell
 
-        for w in filler:
-            if len(options) >= 4:
-                break
-            if w not in options:
-                options.append(w)
+
+def sample_excluding(pool, k, exclude):
+    """
+    pool에서 exclude에 없는 원소 k개를 균등 추출 (pool 전체를 필터링/복사하지 않음).
+    k + len(exclude)개를 먼저 뽑으면 exclude를 빼도 k개 이상 남으므로 앞에서 k개.
+    """
+    picked = random.sample(pool, min(k + len(exclude), len(pool)))
+    return [w for w in picked if w not in exclude][:k]
+
+
+def build_question_for_word(word_row, df_all):
+    # word_row: dict(시뮬) 또는 Series(퀴즈)
+    qtype, question_text, correct, fixed, wrong_pool, example_blank = question_shell(
+        word_row, random.choice(['synonym', 'blank'])
+    )
+    correct_set = frozenset(correct)  # 질문당 한 번 생성, QC/퀴즈 채점 모두 그대로 재사용
+
+    # [A] Synonym: 정답 1 + 오답 3
+    if qtype == 'synonym':
+        needed = 3
+        options = [random.choice(correct)]
+        options += sample_excluding(wrong_pool, needed, correct_set)
+        if len(options) < needed + 1:
+            defaults = ["Option A", "Option B", "Option C"]
+            options += defaults[:needed + 1 - len(options)]
+
+        random.shuffle(options)
+        return qtype, question_text, options, correct_set, {'example_blank': ''}
+
+    # [B] Blank: 정답 + confusables + 같은 topic(/pos) 단어
+    options = list(fixed)
+    options += sample_excluding(wrong_pool, 4 - len(options), set(fixed))
 
     while len(options) < 4:
         options.append(f"Option {len(options)}")
@@ -411,14 +1085,33 @@ def build_question_for_word(word_row, df_all):
 # =========================================================
 # 4) Gemini QC (REAL) - google-genai SDK
 # =========================================================
+@st.cache_resource(show_spinner=False)
+def get_genai_client(api_key: str):
+    """api_key별 genai.Client 재사용 (호출마다 클라이언트 생성/커넥션 새로 맺지 않음)"""
+    try:
+        from google import genai  # QC에서 처음 쓸 때만 import (퀴즈만 쓰는 세션의 시작 시간 단축)
+    except ImportError:
+        raise RuntimeError("google-genai is not installed")
+    return genai.Client(api_key=api_key)
+
+
+@st.cache_resource(show_spinner=False)
+def genai_installed() -> bool:
+    """google-genai 설치 여부 (import 없이 확인 → 미설치 시 Gemini QC만 비활성화, fallback 선택으로 동작)"""
+    try:
+        return importlib.util.find_spec("google.genai") is not None
+    except ModuleNotFoundError:  # google 패키지 자체가 없음
+        return False
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
 def list_gemini_models(api_key: str):
     """
     generateContent 가능한 모델만 반환.
     공식 문서의 models.list 패턴 기반 :contentReference[oaicite:3]{index=3}
+    사이드바가 rerun마다 호출 → 키별로 1시간 캐시 (실패는 캐시 안 됨)
     """
-    from google import genai
-
-    client = genai.Client(api_key=api_key)
+    client = get_genai_client(api_key)
     names = []
     for m in client.models.list():
         # m.supported_actions 또는 m.supported_actions 유사 필드가 올 수 있음
@@ -484,15 +1177,10 @@ def list_gemini_models(api_key: str):
 #     except Exception as e:
 #         return None, f"{type(e).__name__}: {e}"
 
-def gemini_pick_option(api_key: str, model_name: str, question_text: str, example_blank: str, options: list[str],
-                       max_retries: int = 5):
-    """
-    Gemini 호출 (429/일시 오류는 재시도)
-    """
-    from google import genai
-    client = genai.Client(api_key=api_key)
 
-    prompt = f"""
+def build_qc_prompt(question_text: str, example_blank: str, options: list[str]) -> str:
+    """QC용 프롬프트 (개별 호출 / Batch API 공통)"""
+    return f"""
 You are taking a multiple-choice TOEFL vocabulary quiz.
 
 QUESTION:
@@ -502,7 +1190,7 @@ SENTENCE (if any):
 {example_blank if example_blank else ""}
 
 OPTIONS (choose exactly one):
-{json.dumps(options, ensure_ascii=False)}
+{json_dumps(options)}
 
 Return ONLY valid JSON:
 {{
@@ -511,54 +1199,173 @@ Return ONLY valid JSON:
 }}
 """
 
+
+_JSON_OBJ_RE = re.compile(r"\{.*\}", flags=re.DOTALL)
+
+
+def parse_pick_response(text: str):
+    """모델 응답 텍스트 -> ({selected, rationale}, None) 또는 (None, reason)"""
+    text = (text or "").strip()
+
+    # JSON 모드 응답은 그대로 파싱, 정규식은 JSON 모드를 무시하는 모델용 fallback ('{'가 없으면 검색도 안 함)
+    if text.startswith("{") and text.endswith("}"):
+        blob = text
+    else:
+        m = _JSON_OBJ_RE.search(text) if "{" in text else None
+        if not m:
+            return None, f"JSON not found in response: {text[:120]}"
+        blob = m.group(0)
+
+    try:
+        data = json.loads(blob)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+    selected = str(data.get("selected", "")).strip()
+    rationale = str(data.get("rationale", "")).strip()
+    return {"selected": selected, "rationale": rationale}, None
+
+
+@st.cache_resource(show_spinner=False)
+def get_json_mode_rejects():
+    """JSON 모드(response_schema)를 400으로 거절한 모델 이름 (프로세스 공유) → 이후엔 config 없이 바로 호출"""
+    return set()
+
+
+def rejects_json_mode(err) -> bool:
+    """400 INVALID_ARGUMENT 중 JSON 모드/스키마 미지원 오류인지"""
+    msg = str(err)
+    if "400" not in msg and "INVALID_ARGUMENT" not in msg:
+        return False
+    msg = msg.lower()
+    return any(k in msg for k in ("json", "mime", "schema"))
+
+
+def gemini_pick_option(api_key: str, model_name: str, question_text: str, example_blank: str, options: list[str],
+                       max_retries: int = 5):
+    """
+    Gemini 호출 (429/일시 오류는 재시도)
+    JSON 모드를 거절하는 모델이면 config 없이 한 번 더 (응답은 parse_pick_response가 텍스트에서 JSON 추출)
+    """
+    # google-genai 미설치/클라이언트 생성 실패도 (None, err) → 호출 측에서 fallback 선택
+    try:
+        client = get_genai_client(api_key)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+    prompt = build_qc_prompt(question_text, example_blank, options)
+
     last_err = None
+    no_json = get_json_mode_rejects()
+    config = None if model_name in no_json else GEMINI_PICK_CONFIG
 
     for attempt in range(max_retries):
         try:
             resp = client.models.generate_content(
                 model=model_name,
-                contents=prompt
+                contents=prompt,
+                config=config
             )
 
             text = getattr(resp, "text", "") or str(resp)
-            text = text.strip()
-
-            m = re.search(r"\{.*\}", text, flags=re.DOTALL)
-            if not m:
-                return None, f"JSON not found in response: {text[:120]}"
-
-            data = json.loads(m.group(0))
-            selected = str(data.get("selected", "")).strip()
-            rationale = str(data.get("rationale", "")).strip()
-            return {"selected": selected, "rationale": rationale}, None
+            return parse_pick_response(text)
 
         except Exception as e:
             last_err = e
 
+            if config is not None and rejects_json_mode(e):
+                no_json.add(model_name)
+                config = None
+                continue
+
             msg = str(e)
             is_rate_limited = ("429" in msg) or ("RESOURCE_EXHAUSTED" in msg)
             is_transient = is_rate_limited or ("503" in msg) or ("UNAVAILABLE" in msg) or ("DEADLINE" in msg)
 
-            if not is_transient:
+            if not is_transient or attempt == max_retries - 1:
                 break
 
-            # 지수 백오프 + 지터
-            sleep_s = (2 ** attempt) + random.uniform(0, 0.5)
+            # 지수 백오프(1s → 최대 8s) + 지터
+            sleep_s = min(2 ** attempt, 8) + random.uniform(0, 0.5)
             time.sleep(sleep_s)
 
     return None, f"{type(last_err).__name__}: {last_err}"
 
 
-def qc_with_gemini_or_fallback(question_text, example_blank, options, correct_answers, use_gemini, api_key, model_name):
+def gemini_batch_pick(api_key: str, model_name: str, prompts: list[str], timeout_s: int = GEMINI_BATCH_TIMEOUT):
+    """
+    Batch API로 prompts 전체를 inline 요청 한 번에 제출하고 끝날 때까지 폴링(백오프).
+    반환: prompts 순서의 [(data, err), ...]
+    제출 실패/작업 실패/타임아웃/클라이언트 생성 실패면 None (호출 측에서 개별 호출로 대체)
+    """
+    try:
+        client = get_genai_client(api_key)
+    except Exception:
+        return None
+
+    no_json = get_json_mode_rejects()
+    if model_name in no_json:
+        return None  # JSON 모드 없이 보내는 건 개별 호출 경로에서
+    inline_requests = [
+        {"contents": [{"parts": [{"text": p}], "role": "user"}], "config": GEMINI_PICK_CONFIG}
+        for p in prompts
+    ]
+
+    try:
+        job = client.batches.create(
+            model=model_name,
+            src=inline_requests,
+            config={"display_name": f"toefl-voca-qc-{int(time.time())}"}
+        )
+
+        deadline = time.monotonic() + timeout_s
+        wait_s = 2
+        while getattr(job.state, "name", str(job.state)) not in GEMINI_BATCH_DONE_STATES:
+            if time.monotonic() > deadline:
+                try:
+                    client.batches.cancel(name=job.name)
+                except Exception:
+                    pass
+                return None
+            time.sleep(wait_s)
+            wait_s = min(wait_s * 2, 30)
+            job = client.batches.get(name=job.name)
+
+        if getattr(job.state, "name", str(job.state)) != "JOB_STATE_SUCCEEDED":
+            return None
+
+        results = []
+        for r in job.dest.inlined_responses:
+            if getattr(r, "response", None) is not None:
+                results.append(parse_pick_response(getattr(r.response, "text", "")))
+            elif rejects_json_mode(getattr(r, "error", "")):
+                # JSON 모드 미지원 모델 → 개별 호출(config 없이 재시도)로 대체
+                no_json.add(model_name)
+                return None
+            else:
+                results.append((None, f"Batch item error: {getattr(r, 'error', '')}"))
+
+        if len(results) != len(prompts):
+            return None
+        return results
+
+    except Exception:
+        return None
+
+
+def qc_with_gemini_or_fallback(question_text, example_blank, options, correct_answers, use_gemini, api_key, model_name,
+                               pick=None):
     """
     반환: dict {flag, reasons, llm_selected, llm_is_correct}
     - llm_selected / llm_is_correct는 절대 빈값 방지
     - flag는 '구조 오류' 위주로 1로 둠 (원하면 LLM 오답도 flag로 올릴 수 있음)
+    - pick: Batch API 등으로 미리 받아둔 (data, err). 있으면 Gemini를 다시 호출하지 않음
     """
     reasons = []
     flag = 0
 
-    correct_answers = set(correct_answers)
+    if not isinstance(correct_answers, (set, frozenset)):
+        correct_answers = frozenset(correct_answers)
 
     # 구조 체크
     if not any(opt in correct_answers for opt in options):
@@ -584,7 +1391,10 @@ def qc_with_gemini_or_fallback(question_text, example_blank, options, correct_an
         }
 
     # Gemini 사용
-    data, err = gemini_pick_option(api_key, model_name, question_text, example_blank, options)
+    if pick is not None:
+        data, err = pick
+    else:
+        data, err = gemini_pick_option(api_key, model_name, question_text, example_blank, options)
     if err or not data:
         # 실패하면 fallback
         reasons.append(f"Gemini call failed; used fallback selection. ({err})")
@@ -623,6 +1433,60 @@ def qc_with_gemini_or_fallback(question_text, example_blank, options, correct_an
     }
 
 
+@st.cache_resource(show_spinner=False)
+def get_gemini_pick_cache():
+    """세션 간 공유하는 Gemini 선택 캐시 {key: (저장 시각, (data, None))}. 성공한 응답만 GEMINI_PICK_TTL 동안."""
+    return {"lock": threading.Lock(), "items": {}}
+
+
+def cached_gemini_picks(keys):
+    """keys 중 캐시에 있고 만료 안 된 것만 {key: (data, None)}"""
+    cache = get_gemini_pick_cache()
+    now = time.time()
+    hits = {}
+    with cache["lock"]:
+        for k in keys:
+            item = cache["items"].get(k)
+            if item is not None and now - item[0] < GEMINI_PICK_TTL:
+                hits[k] = item[1]
+    return hits
+
+
+def store_gemini_picks(picks):
+    """picks {key: (data, err)} 중 성공한 것만 저장 (실패는 다음 실행에서 재시도). 만료 항목은 이때 정리."""
+    cache = get_gemini_pick_cache()
+    now = time.time()
+    with cache["lock"]:
+        items = {k: v for k, v in cache["items"].items() if now - v[0] < GEMINI_PICK_TTL}
+        items.update({k: (now, pick) for k, pick in picks.items() if pick[1] is None})
+        cache["items"] = items
+
+
+async def _gather_with_limits(jobs, concurrency, rps):
+    """
+    jobs(인자 없는 동기 함수들)를 스레드로 동시에 실행.
+    Semaphore로 동시 요청 수를, 토큰 버킷(1/rps 간격 슬롯)으로 초당 요청 수를 제한.
+    결과는 jobs 순서 그대로 반환.
+    """
+    sem = asyncio.Semaphore(concurrency)
+    lock = asyncio.Lock()
+    interval = 1.0 / rps
+    next_slot = time.monotonic()
+
+    async def _run(job):
+        nonlocal next_slot
+        async with sem:
+            async with lock:
+                now = time.monotonic()
+                wait = next_slot - now
+                next_slot = max(now, next_slot) + interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+            return await asyncio.to_thread(job)
+
+    return await asyncio.gather(*(_run(job) for job in jobs))
+
+
 # =========================================================
 # 5) UI
 # =========================================================
@@ -631,14 +1495,58 @@ st.title("🎓 NicholaSOOBIN TOEFL Voca")
 with st.sidebar:
     st.header("Data Management")
     if st.button("Reset All Progress"):
-        df_reset = st.session_state.vocab_db.copy()
-        df_reset['box'] = 0
-        df_reset['next_review'] = '0000-00-00'
-        df_reset['mistake_count'] = 0
-        conn.update(worksheet=SHEET_MAIN, data=df_reset)
-        st.toast("All progress has been reset.")
-        st.session_state.clear()
-        st.rerun()
+        # writer에 남은 쓰기를 먼저 비움. 실패/timeout이면 리셋 취소
+        # (재시도 중인 이전 답안 값이 리셋한 셀을 다시 덮어쓰지 않도록)
+        if not flush_srs():
+            st.error("Reset cancelled: pending progress could not be saved. Try again shortly.")
+        else:
+            # 바뀌는 건 SRS 컬럼뿐 → 그 컬럼 범위만 상수값으로 batchUpdate (DataFrame 복사/전체 업로드 X)
+            df_db = st.session_state.vocab_db
+            reset_values = {col: COLUMN_DEFAULTS[col] for col in SRS_COLUMNS}
+            try:
+                writer = get_srs_writer()
+                layout = writer["layout"]
+                letters = layout["letters"]
+                # 행 범위는 시트 id 컬럼 기준 (df 길이 X): id가 있는 행만 기본값, id 없는 행은 빈 칸
+                id_rows, last = read_sheet_rows(writer["ws"], layout["id_col"])
+                rows = set(id_rows.values())
+                # 붙어 있는 컬럼 묶음마다 range 하나 (H2:J{last})
+                data = [{"range": f"{letters[run[0]]}2:{letters[run[-1]]}{last}",
+                         "values": [[reset_values[col] if row in rows else "" for col in run]
+                                    for row in range(2, last + 1)]}
+                        for run in layout["runs"] if last >= 2]
+                writer["ws"].batch_update(data, value_input_option="RAW")
+            except Exception as e:
+                # 시트가 안 바뀌었으므로 DataFrame/세션도 그대로 둠
+                st.error(f"Reset failed: {e}")
+            else:
+                drop_vocab_snapshot()
+                with vocab_lock():
+                    for col, value in reset_values.items():
+                        df_db.loc[:, col] = value  # 제자리 대입 (int8/int16/float32 dtype 유지)
+                st.toast("All progress has been reset.")
+                st.session_state.clear()
+                st.rerun()
+
+    if st.button("Reload Vocab"):
+        # 시트를 직접 고친 뒤 반영. 쌓인 SRS 쓰기를 먼저 저장하고 다시 읽음
+        if not flush_srs():
+            st.error("Reload cancelled: pending progress could not be saved. Try again shortly.")
+        else:
+            try:
+                notices = reload_vocab()
+            except Exception as e:
+                st.error(f"Reload failed: {e}")
+            else:
+                for key in VOCAB_SESSION_KEYS:
+                    st.session_state.pop(key, None)
+                # 퀴즈 중인 단어가 시트에서 빠졌으면 다음 단어로
+                if st.session_state.get('current_word_id') not in get_vocab_store()["id_to_pos"]:
+                    st.session_state.current_word_id = None
+                for notice in notices:
+                    st.toast(notice)
+                st.toast("Vocab reloaded from Google Sheet.")
+                st.rerun()
 
     st.divider()
     st.header("QC (Gemini)")
@@ -659,12 +1567,18 @@ with st.sidebar:
 
     sim_n = st.number_input("Simulate N questions", min_value=1, max_value=2000, value=100, step=50)
 
-    # 모델 목록 로딩 (키가 있을 때만)
+    use_batch = st.toggle(
+        "Use Gemini Batch API",
+        value=False,
+        help="ON이면 QC 문제 전체를 Batch API로 한 번에 제출합니다 (대량 N에 유리, 완료까지 대기). 실패하면 개별 호출로 대체."
+    )
+
+    # 모델 목록 로딩 (키가 있고 Gemini를 쓸 때만 → 끄면 google-genai import도 안 함)
     api_key = st.secrets.get("GEMINI_API_KEY", "")
     model_candidates = []
     model_name = DEFAULT_GEMINI_MODEL
 
-    if api_key:
+    if api_key and use_gemini:
         try:
             model_candidates = list_gemini_models(api_key)
         except Exception as e:
@@ -682,13 +1596,17 @@ with st.sidebar:
         st.caption(f"Using default model: {DEFAULT_GEMINI_MODEL}")
 
     if st.button("Run QC Simulation"):
-        ok = ensure_qc_sheet_and_header()
-        if not ok:
-            st.stop()
+        if not st.session_state.get("_qc_ensured"):
+            if not ensure_qc_sheet_and_header():
+                st.stop()
+            st.session_state._qc_ensured = True
 
         if use_gemini and not api_key:
             st.error("❌ GEMINI_API_KEY not found in st.secrets")
             st.stop()
+        if use_gemini and not genai_installed():
+            st.warning("google-genai가 설치되지 않아 Gemini 없이 fallback 선택으로 QC합니다.")
+            use_gemini = False
 
         df_all = st.session_state.vocab_db
         session_id = random.randint(10, 10000)
@@ -696,21 +1614,66 @@ with st.sidebar:
         logs = []
         flagged = 0
 
-        sampled = df_all.sample(min(int(sim_n), len(df_all))).to_dict("records")
+        # 전체 프레임 셔플 없이 위치만 뽑고 그 행들만 dict로
+        picked = st.session_state.rng.choice(len(df_all), size=min(int(sim_n), len(df_all)), replace=False)
+        with vocab_lock():
+            sampled = df_all.iloc[picked].to_dict("records")
+
+        # 문제 생성은 session_state를 쓰므로 여기서(스크립트 스레드) 먼저 전부 만들고,
+        # 네트워크 바운드인 Gemini 호출만 동시 실행
+        questions = [build_question_for_word(row, df_all) for row in sampled]
+        qc_model = model_name if model_candidates else DEFAULT_GEMINI_MODEL
+
+        picks = [None] * len(questions)
+        if use_gemini:
+            # 보기 순서만 다른 같은 문제는 같은 key (선택값은 보기 문자열이라 순서와 무관) → 한 번만 호출
+            keys = [(qc_model, qtext, extra.get("example_blank", ""), tuple(sorted(options)))
+                    for _, qtext, options, _, extra in questions]
+            key_args = {}
+            for key, (_, qtext, options, _, extra) in zip(keys, questions):
+                key_args.setdefault(key, (qtext, extra.get("example_blank", ""), options))
+
+            # 다른 세션/이전 실행의 성공 결과 재사용
+            cached = cached_gemini_picks(key_args)
+            todo = [k for k in key_args if k not in cached]
+            fetched = {}
+
+            if todo and use_batch:
+                prompts = [build_qc_prompt(*key_args[k]) for k in todo]
+                with st.spinner(f"Gemini Batch API: {len(prompts)} questions (waiting for the batch job)..."):
+                    batch_picks = gemini_batch_pick(api_key, qc_model, prompts)
+                if batch_picks is None:
+                    st.warning("Batch API failed or timed out; falling back to individual calls.")
+                else:
+                    fetched = dict(zip(todo, batch_picks))
+
+            todo = [k for k in todo if k not in fetched]
+            if todo:
+                jobs = [functools.partial(gemini_pick_option, api_key, qc_model, *key_args[k]) for k in todo]
+                with st.spinner(f"Gemini QC: {len(jobs)} questions..."):
+                    fetched.update(zip(todo, asyncio.run(_gather_with_limits(jobs, GEMINI_CONCURRENCY, GEMINI_RPS))))
 
-        for row in sampled:
-            qtype, qtext, options, correct_set, extra = build_question_for_word(row, df_all)
-            ex_blank = extra.get("example_blank", "")
+            store_gemini_picks(fetched)
+            picks = [cached.get(k) or fetched[k] for k in keys]
 
-            qc = qc_with_gemini_or_fallback(
+        qc_results = [
+            qc_with_gemini_or_fallback(
                 question_text=qtext,
-                example_blank=ex_blank,
+                example_blank=extra.get("example_blank", ""),
                 options=options,
                 correct_answers=correct_set,
                 use_gemini=use_gemini,
                 api_key=api_key,
-                model_name=model_name if model_candidates else DEFAULT_GEMINI_MODEL
+                model_name=qc_model,
+                pick=pick
             )
+            for (_, qtext, options, correct_set, extra), pick in zip(questions, picks)
+        ]
+
+        # 한 번의 QC 실행은 같은 시각으로 기록 (행마다 now()/strftime 하지 않음)
+        ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for row, (qtype, qtext, options, correct_set, extra), qc in zip(sampled, questions, qc_results):
+            ex_blank = extra.get("example_blank", "")
 
             if int(qc.get("flag", 0)) == 1:
                 flagged += 1
@@ -724,60 +1687,39 @@ with st.sidebar:
             if not llm_is_correct:
                 llm_is_correct = "TRUE" if (llm_selected in correct_set) else "FALSE"
 
-            logs.append({
-                "ts": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "session_id": int(session_id),
-                "word_id": int(row.get("id")),
-                "word": str(row.get("word", "")),
-                "qtype": qtype,
-                "question_text": qtext,
-                "example_blank": ex_blank,
-                "options": json.dumps(options, ensure_ascii=False),
-                "correct_answers": json.dumps(sorted(list(correct_set)), ensure_ascii=False),
-                "llm_selected": llm_selected,
-                "llm_is_correct": llm_is_correct,  # TRUE/FALSE
-                "flag": int(qc.get("flag", 0)),
-                "reasons": json.dumps(qc.get("reasons", []), ensure_ascii=False),
-            })
-
-        append_qc_log(logs)
-        st.success(f"QC done. Flagged: {flagged} / {len(logs)} (session_id={session_id})")
-        st.caption("Google Sheet → QC_Log 탭에서 확인하세요.")
-
-# ---------------------------
-# Main App: Setup / Quiz / Summary
-# ---------------------------
-if st.session_state.app_mode == 'setup':
-    st.markdown("### ⚙️ Study Setup")
-
-    with st.form("setup_form"):
-        c1, c2 = st.columns(2)
-        with c1:
-            topic_list = ["All", "Science", "History", "Social Science", "Business", "Environment", "Education"]
-            sel_topic = st.selectbox("Topic", topic_list)
-            sel_mode = st.radio(
-                "Mode",
-                ["Standard Study (SRS)", "Review Mistakes Only"],
-                help="Standard: New & Due words | Mistakes: Words you got wrong before"
-            )
-        with c2:
-            sel_goal = st.selectbox("Daily Goal", [5, 10, 15, 20, 30])
-            sel_diff = st.slider("Difficulty", 1, 3, (1, 3))
-
-        submitted = st.form_submit_button("🚀 Start Session", use_container_width=True)
+            # QC_COLUMNS 순서 그대로 한 행 (dict 거치지 않고 append_qc_rows로)
+            logs.append([
+                ts,
+                int(session_id),
+                int(row.get("id")),
+                str(row.get("word", "")),
+                qtype,
+                qtext,
+                ex_blank,
+                json_dumps(options),
+                json_dumps(sorted(correct_set)),
+                llm_selected,
+                llm_is_correct,  # TRUE/FALSE
+                int(qc.get("flag", 0)),
+                json_dumps(qc.get("reasons", [])),
+            ])
+
+        # 시트 전송은 백그라운드라 여기서는 outbox에 넣은 것까지만 알림
+        if append_qc_rows(logs):
+            st.success(f"QC done. Flagged: {flagged} / {len(logs)} — {len(logs)} rows queued for QC_Log "
+                       f"(session_id={session_id})")
+            st.caption("백그라운드로 QC_Log 탭에 전송 중입니다 (몇 초 걸릴 수 있음). 실패한 행은 outbox에 남아 다시 전송됩니다.")
+        else:
+            st.warning(f"QC done. Flagged: {flagged} / {len(logs)} — rows were not queued for QC_Log "
+                       f"(session_id={session_id})")
 
-        if submitted:
-            st.session_state.session_config = {
-                'topic': sel_topic,
-                'goal': sel_goal,
-                'difficulty': sel_diff,
-                'mode': sel_mode
-            }
-            st.session_state.session_stats = {'correct': 0, 'wrong': 0, 'total': 0}
-            st.session_state.app_mode = 'quiz'
-            st.rerun()
 
-elif st.session_state.app_mode == 'quiz':
+@st.fragment
+def quiz_card():
+    """
+    퀴즈 화면. 보기 선택/Next 클릭은 이 fragment만 rerun
+    (사이드바·설정 등 스크립트 전체를 다시 돌지 않음). 화면 전환만 전체 rerun.
+    """
     config = st.session_state.session_config
     stats = st.session_state.session_stats
 
@@ -787,8 +1729,9 @@ elif st.session_state.app_mode == 'quiz':
     st.caption(f"Progress: {current} / {goal} (Topic: {config['topic']})")
 
     if current >= goal:
+        flush_srs()
         st.session_state.app_mode = 'summary'
-        st.rerun()
+        st.rerun()  # 화면 전환은 앱 전체 rerun
 
     df_all = st.session_state.vocab_db
 
@@ -796,7 +1739,8 @@ elif st.session_state.app_mode == 'quiz':
         new_id = get_next_word()
         if new_id is not None:
             st.session_state.current_word_id = new_id
-            current_word = df_all[df_all['id'] == new_id].iloc[0]
+            with vocab_lock():
+                current_word = df_all.iloc[st.session_state.id_to_idx[new_id]]
 
             qtype, qtext, options, correct_set, extra = build_question_for_word(current_word, df_all)
 
@@ -813,12 +1757,14 @@ elif st.session_state.app_mode == 'quiz':
             if config['mode'] == 'Review Mistakes Only':
                 st.info("💡 You have no recorded mistakes yet! Try 'Standard Study (SRS)'.")
             if st.button("Back to Setup"):
+                flush_srs()
                 st.session_state.app_mode = 'setup'
                 st.rerun()
             st.stop()
 
     current_id = st.session_state.current_word_id
-    current_word_row = df_all[df_all['id'] == current_id].iloc[0]
+    with vocab_lock():
+        current_word_row = df_all.iloc[st.session_state.id_to_idx[int(current_id)]]
     word_text = str(current_word_row.get('word', '')).strip()
 
     st.markdown(st.session_state.question_text)
@@ -828,14 +1774,8 @@ elif st.session_state.app_mode == 'quiz':
         if blank_sentence:
             st.info(blank_sentence)
 
-    try:
-        sound_file = BytesIO()
-        tts = gTTS(text=word_text, lang='en')
-        tts.write_to_fp(sound_file)
-        sound_file.seek(0)
-        st.audio(sound_file, format='audio/mpeg')
-    except Exception:
-        pass
+    # 발음은 자리만 잡아두고 카드 맨 끝에서 채움 → gTTS 캐시 미스여도 문제/보기가 먼저 그려짐
+    audio_slot = st.empty()
 
     st.caption(f"Part of Speech: *{current_word_row.get('pos', '')}*")
 
@@ -848,7 +1788,7 @@ elif st.session_state.app_mode == 'quiz':
 
                 is_correct = option in st.session_state.correct_answers
                 update_srs(current_id, is_correct)
-                st.rerun()
+                st.rerun(scope="fragment")
 
     else:
         selected = st.session_state.selected_option
@@ -869,7 +1809,7 @@ elif st.session_state.app_mode == 'quiz':
         )
 
         if st.session_state.question_type == 'blank':
-            colls = parse_list(current_word_row.get('collocations', ''))
+            colls = current_word_row.get('collocations') or []  # load_data에서 이미 list로 파싱됨
             if colls:
                 st.caption("Collocations: " + ", ".join(colls))
 
@@ -877,13 +1817,65 @@ elif st.session_state.app_mode == 'quiz':
             st.session_state.current_word_id = None
             st.session_state.quiz_answered = False
             st.session_state.selected_option = None
-            st.session_state.correct_answers = set()
+            st.session_state.correct_answers = frozenset()
             st.session_state.question_type = None
             st.session_state.question_text = ""
             st.session_state.quiz_options = []
             st.session_state.example_blank_to_show = ""
+            st.rerun(scope="fragment")
+
+    try:
+        audio = st.session_state.get('tts_prefetch', {}).get(word_text) or tts_bytes(word_text)
+        audio_slot.audio(audio, format='audio/mpeg')
+    except Exception:
+        pass
+
+
+# ---------------------------
+# Main App: Setup / Quiz / Summary
+# ---------------------------
+if st.session_state.app_mode == 'setup':
+    st.markdown("### ⚙️ Study Setup")
+
+    with st.form("setup_form"):
+        c1, c2 = st.columns(2)
+        with c1:
+            topic_list = ["All", "Science", "History", "Social Science", "Business", "Environment", "Education"]
+            sel_topic = st.selectbox("Topic", topic_list)
+            sel_mode = st.radio(
+                "Mode",
+                ["Standard Study (SRS)", "Review Mistakes Only"],
+                help="Standard: New & Due words | Mistakes: Words you got wrong before"
+            )
+        with c2:
+            sel_goal = st.selectbox("Daily Goal", [5, 10, 15, 20, 30])
+            sel_diff = st.slider("Difficulty", 1, 3, (1, 3))
+
+        submitted = st.form_submit_button("🚀 Start Session", use_container_width=True)
+
+        if submitted:
+            st.session_state.session_config = {
+                'topic': sel_topic,
+                'goal': sel_goal,
+                'difficulty': sel_diff,
+                'mode': sel_mode
+            }
+            st.session_state.session_stats = {'correct': 0, 'wrong': 0, 'total': 0}
+
+            # 이번 세션에 나올 수 있는 단어 발음을 미리 생성 (퀴즈 화면에서 gTTS 대기 줄이기)
+            candidates = current_candidates()
+            if len(candidates):
+                size = min(int(sel_goal) * 3, TTS_PREFETCH_MAX, len(candidates))
+                picked = st.session_state.rng.choice(candidates, size=size, replace=False)
+                words = st.session_state.vocab_db['word'].to_numpy()[picked]
+                prefetch_tts([w.strip() for w in words if isinstance(w, str)])
+
+            st.session_state.app_mode = 'quiz'
             st.rerun()
 
+elif st.session_state.app_mode == 'quiz':
+    quiz_card()
+
 elif st.session_state.app_mode == 'summary':
     st.balloons()
     st.markdown("## 🏆 Session Complete!")
@@ -0,0 +1,60 @@
+"""
+SRS 스케줄 계산 (순수 함수만, streamlit/pandas 의존 X → main.py와 tests에서 같이 사용)
+"""
+import math
+
+# FSRS-4.5 기본 가중치. 퀴즈는 정답/오답뿐이라 Good(3)/Again(1)만 사용
+FSRS_W = (0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+          0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755)
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81  # R(t=S) = 0.9 가 되도록 맞춘 값
+FSRS_RETENTION = 0.9   # 목표 기억 유지율 → 복습 간격
+FSRS_MAX_DAYS = 365
+
+
+def srs_step(box, mistakes, is_correct):
+    """
+    box/오답 수 한 단계 (순수 함수): (box, mistakes, 정답 여부) -> (new_box, new_mistakes)
+    정답: box+1 (최대 5) / 오답: box 0, mistakes+1 (복습 간격은 fsrs_step)
+    """
+    if is_correct:
+        return min(box + 1, 5), mistakes
+    return 0, mistakes + 1
+
+
+def fsrs_step(stability, difficulty, elapsed_days, is_correct):
+    """
+    FSRS-4.5 한 단계 (순수 함수): -> (new_stability, new_difficulty, days_to_add)
+    stability <= 0 이면 새 카드. 정답=Good, 오답=Again (오답은 기존처럼 오늘 다시)
+    """
+    w = FSRS_W
+    grade = 3 if is_correct else 1
+
+    if stability <= 0:
+        new_s = w[grade - 1]
+        new_d = w[4] - (grade - 3) * w[5]
+    else:
+        r = (1 + FSRS_FACTOR * max(elapsed_days, 0) / stability) ** FSRS_DECAY
+        new_d = w[7] * w[4] + (1 - w[7]) * (difficulty - w[6] * (grade - 3))
+        if is_correct:
+            new_s = stability * (1 + math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                                 * (math.exp(w[10] * (1 - r)) - 1))
+        else:
+            new_s = min(stability, w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+                        * math.exp(w[14] * (1 - r)))
+    new_d = min(max(new_d, 1.0), 10.0)
+
+    if not is_correct:
+        return new_s, new_d, 0
+    interval = new_s / FSRS_FACTOR * (FSRS_RETENTION ** (1 / FSRS_DECAY) - 1)
+    return new_s, new_d, min(max(int(round(interval)), 1), FSRS_MAX_DAYS)
+
+
+def leitner_seed(box, next_review_i):
+    """
+    FSRS 도입 전(Leitner) 카드의 FSRS 상태: 간격 2^box일 → stability = 2^box,
+    마지막 복습 = next_review - 2^box (next_review 없으면 0), difficulty = 첫 Good 기본값.
+    -> (stability, difficulty, last_review_i). 정수 또는 같은 길이 NumPy 정수 배열 모두 가능
+    """
+    interval = 2 ** box
+    return interval, FSRS_W[4], (next_review_i > 0) * (next_review_i - interval)
@@ -0,0 +1,35 @@
+from srs import FSRS_MAX_DAYS, FSRS_W, fsrs_step, leitner_seed, srs_step
+
+
+def test_new_card_good():
+    # 새 카드 정답 → stability = w[2], 간격 = round(w[2]) 일 (R=0.9 기준)
+    s, d, days = fsrs_step(0.0, 0.0, 0, True)
+    assert s == FSRS_W[2]
+    assert d == FSRS_W[4]
+    assert days == 4
+
+
+def test_lapse_resets_to_today():
+    # 오답은 오늘 다시, stability는 줄고 difficulty는 오름
+    s, d, days = fsrs_step(20.0, 5.0, 20, False)
+    assert days == 0
+    assert s < 20.0
+    assert d > 5.0
+    assert srs_step(4, 2, False) == (0, 3)
+
+
+def test_box_step():
+    assert srs_step(0, 0, True) == (1, 0)
+    assert srs_step(5, 1, True) == (5, 1)
+
+
+def test_leitner_seed():
+    # box 5 (간격 32일) 카드: stability 32, 마지막 복습 = next_review - 32
+    s, d, last = leitner_seed(5, 20000)
+    assert (s, d, last) == (32, FSRS_W[4], 19968)
+    # next_review가 없으면 마지막 복습도 0
+    assert leitner_seed(3, 0)[2] == 0
+    # 제때 맞히면 간격이 32일보다 늘어남
+    _, _, days = fsrs_step(s, d, 20000 - last, True)
+    assert 32 < days <= FSRS_MAX_DAYS
+    assert days == 99